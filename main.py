@@ -1,500 +1,1067 @@
-import re
-import sys
-
-# ============================================================================
-# Tokenizer
-# ============================================================================
-
-def tokenize(code):
-    """將輸入字串轉換為 token 串列"""
-    tokens = []
-    i = 0
-    
-    while i < len(code):
-        # 跳過空白字符
-        if code[i] in ' \t\n\r':
-            i += 1
-            continue
-        
-        # 跳過註解
-        if code[i] == ';':
-            while i < len(code) and code[i] != '\n':
-                i += 1
-            continue
-        
-        # 括號
-        if code[i] in '()':
-            tokens.append(code[i])
-            i += 1
-            continue
-        
-        # Boolean
-        if i + 1 < len(code) and code[i:i+2] in ['#t', '#f']:
-            tokens.append(code[i:i+2])
-            i += 2
-            continue
-        
-        # 負數或減號
-        if code[i] == '-':
-            if i + 1 < len(code) and code[i+1].isdigit():
-                # 負數
-                j = i + 1
-                while j < len(code) and code[j].isdigit():
-                    j += 1
-                tokens.append(code[i:j])
-                i = j
-            else:
-                # 減號運算子
-                tokens.append('-')
-                i += 1
-            continue
-        
-        # 正數
-        if code[i].isdigit():
-            j = i
-            while j < len(code) and code[j].isdigit():
-                j += 1
-            tokens.append(code[i:j])
-            i = j
-            continue
-        
-        # ID 或運算子
-        if code[i].isalpha() or code[i] in '+*/<>=':
-            j = i
-            # 單字符運算子
-            if code[i] in '+*/<>=' and (i + 1 >= len(code) or code[i+1] in ' \t\n\r()'):
-                tokens.append(code[i])
-                i += 1
-                continue
-            # ID: letter (letter | digit | '-')*
-            while j < len(code) and (code[j].isalnum() or code[j] == '-'):
-                j += 1
-            tokens.append(code[i:j])
-            i = j
-            continue
-        
-        # 其他字符跳過
-        i += 1
-    
-    return tokens
-
-# ============================================================================
-# Parser
-# ============================================================================
-
-class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
-    
-    def peek(self):
-        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
-    
-    def consume(self):
-        token = self.peek()
-        self.pos += 1
-        return token
-    
-    def parse_program(self):
-        """PROGRAM ::= STMT+"""
-        stmts = []
-        while self.peek() is not None:
-            stmts.append(self.parse_stmt())
-        return ('program', stmts)
-    
-    def parse_stmt(self):
-        """STMT ::= EXP"""
-        return self.parse_exp()
-    
-    def parse_exp(self):
-        """EXP ::= bool-val | number | VARIABLE | (...)"""
-        token = self.peek()
-        
-        if token is None:
-            raise SyntaxError("syntax error")
-        
-        # Boolean literals
-        if token in ['#t', '#f']:
-            self.consume()
-            return token == '#t'
-        
-        # Number literals
-        if token.lstrip('-').isdigit():
-            self.consume()
-            return int(token)
-        
-        # S-expression
-        if token == '(':
-            self.consume()
-            return self.parse_sexp()
-        
-        # Variable
-        if re.match(r'^[a-z][\w-]*$', token):
-            self.consume()
-            return ('var', token)
-        
-        raise SyntaxError("syntax error")
-    
-    def expect(self, expected):
-        """消耗並檢查 token"""
-        token = self.consume()
-        if token != expected:
-            raise SyntaxError("syntax error")
-    
-    def parse_sexp(self):
-        """解析 S-expression (已消耗左括號)"""
-        op = self.peek()
-        
-        if op is None or op == ')':
-            raise SyntaxError("syntax error")
-        
-        # Print
-        if op in ['print-num', 'print-bool']:
-            self.consume()
-            exp = self.parse_exp()
-            self.expect(')')
-            return (op, exp)
-        
-        # Define
-        if op == 'define':
-            self.consume()
-            var = self.consume()
-            if not var or not re.match(r'^[a-z][\w-]*$', var):
-                raise SyntaxError("syntax error")
-            value = self.parse_exp()
-            self.expect(')')
-            return ('define', var, value)
-        
-        # Function
-        if op == 'fun':
-            self.consume()
-            self.expect('(')
-            
-            params = []
-            while self.peek() != ')':
-                param = self.consume() 
-                if not param or not re.match(r'^[a-z][\w-]*$', param):
-                    raise SyntaxError("syntax error")
-                params.append(param)
-            self.expect(')')
-            
-            # nested function: fun-body ::= def-stmt* exp
-            body_defs = []
-            while self.peek() == '(':
-                saved = self.pos
-                self.consume()
-                if self.peek() == 'define':
-                    self.pos = saved
-                    body_defs.append(self.parse_exp())
-                else:
-                    self.pos = saved
-                    break
-            
-            body = self.parse_exp()
-            self.expect(')')
-            
-            if body_defs:
-                return ('fun', params, ('fun-body', body_defs, body))
-            return ('fun', params, body)
-        
-        # If
-        if op == 'if':
-            self.consume()
-            test = self.parse_exp()
-            then_exp = self.parse_exp()
-            else_exp = self.parse_exp()
-            self.expect(')')
-            return ('if', test, then_exp, else_exp)
-        
-        # Arithmetic operators
-        if op in ['+', '*']:
-            self.consume()
-            exps = []
-            while self.peek() != ')':
-                exps.append(self.parse_exp())
-            self.expect(')')
-            if len(exps) < 2:
-                raise SyntaxError("syntax error")
-            return (op, exps)
-        
-        if op in ['-', '/', 'mod']:
-            self.consume()
-            exp1 = self.parse_exp()
-            exp2 = self.parse_exp()
-            self.expect(')')
-            return (op, [exp1, exp2])
-        
-        # Comparison operators
-        if op == '=':
-            self.consume()
-            exps = []
-            while self.peek() != ')':
-                exps.append(self.parse_exp())
-            self.expect(')')
-            if len(exps) < 2:
-                raise SyntaxError("syntax error")
-            return (op, exps)
-        
-        if op in ['>', '<']:
-            self.consume()
-            exp1 = self.parse_exp()
-            exp2 = self.parse_exp()
-            self.expect(')')
-            return (op, [exp1, exp2])
-        
-        # Logical operators
-        if op in ['and', 'or']:
-            self.consume()
-            exps = []
-            while self.peek() != ')':
-                exps.append(self.parse_exp())
-            self.expect(')')
-            if len(exps) < 2:
-                raise SyntaxError("syntax error")
-            return (op, exps)
-        
-        if op == 'not':
-            self.consume()
-            exp = self.parse_exp()
-            self.expect(')')
-            return ('not', exp)
-        
-        # Function call: (func args...)
-        func = self.parse_exp()
-        args = []
-        while self.peek() != ')':
-            args.append(self.parse_exp())
-        self.expect(')')
-        return ('call', func, args)
-
-# ============================================================================
-# Runtime
-# ============================================================================
-
-class Environment:
-    def __init__(self, parent=None):
-        self.vars = {}
-        self.parent = parent
-    
-    def define(self, name, value):
-        if name in self.vars:
-            raise RuntimeError(f"Redefining variable: {name}")
-        self.vars[name] = value
-    
-    def lookup(self, name):
-        if name in self.vars:
-            return self.vars[name]
-        if self.parent:
-            return self.parent.lookup(name)
-        raise RuntimeError(f"Undefined variable: {name}")
-
-class Function:
-    def __init__(self, params, body, closure_env):
-        self.params = params
-        self.body = body
-        self.closure_env = closure_env
-    
-    def call(self, args):
-        if len(args) != len(self.params):
-            raise RuntimeError(f"Arity mismatch: expected {len(self.params)}, got {len(args)}")
-        
-        local_env = Environment(parent=self.closure_env)
-        for param, arg in zip(self.params, args):
-            local_env.define(param, arg)
-        
-        return evaluate(self.body, local_env)
-
-# ============================================================================
-# Evaluator
-# ============================================================================
-
-# Type checking 開關 
-TYPE_CHECKING = True
-
-def type_error(expected, got):
-    """印出 type error 並結束程式"""
-    print("Type error!")
-    sys.exit(0)  # 正常結束，不是錯誤
-
-def check_number(val, op):
-    """檢查是否為 number ( bool 是 int 的子類 )"""
-    if TYPE_CHECKING:
-        if isinstance(val, bool):  # bool 要先檢查
-            type_error('number', val)
-        if not isinstance(val, int):
-            type_error('number', val)
-
-def check_boolean(val, op):
-    """檢查是否為 boolean"""
-    if TYPE_CHECKING:
-        if not isinstance(val, bool):
-            type_error('boolean', val)
-
-def evaluate(expr, env):
-    """評估表達式"""
-    # Literals
-    if isinstance(expr, (bool, int)):
-        return expr
-    
-    if not isinstance(expr, tuple):
-        raise RuntimeError(f"Invalid expression: {expr}")
-    
-    op = expr[0]
-    
-    # Variable
-    if op == 'var':
-        return env.lookup(expr[1])
-    
-    # Print
-    if op == 'print-num':
-        value = evaluate(expr[1], env)
-        check_number(value, 'print-num')
-        print(value)
-        return value
-    
-    if op == 'print-bool':
-        value = evaluate(expr[1], env)
-        check_boolean(value, 'print-bool')
-        print('#t' if value else '#f')
-        return value
-    
-    # Define
-    if op == 'define':
-        value = evaluate(expr[2], env)
-        env.define(expr[1], value)
-        return value
-    
-    # Function
-    if op == 'fun':
-        # params, body, closure_env
-        return Function(expr[1], expr[2], env)
-    
-    # Function body with nested defines
-    if op == 'fun-body':
-        for def_stmt in expr[1]:
-            evaluate(def_stmt, env)
-        return evaluate(expr[2], env)
-    
-    # If
-    # if cond then else
-    if op == 'if':
-        test = evaluate(expr[1], env)
-        check_boolean(test, 'if')
-        return evaluate(expr[2] if test else expr[3], env)
-    
-    # Arithmetic
-    # +, * 因為可以多參數，所以不一樣
-    if op == '+':
-        result = 0
-        for e in expr[1]:
-            val = evaluate(e, env)
-            check_number(val, '+')
-            result += val
-        return result
-    
-    if op == '-':
-        vals = [evaluate(e, env) for e in expr[1]]
-        check_number(vals[0], '-')
-        check_number(vals[1], '-')
-        return vals[0] - vals[1]
-    
-    if op == '*':
-        result = 1
-        for e in expr[1]:
-            val = evaluate(e, env)
-            check_number(val, '*')
-            result *= val
-        return result
-    
-    if op == '/':
-        vals = [evaluate(e, env) for e in expr[1]]
-        check_number(vals[0], '/')
-        check_number(vals[1], '/')
-        return vals[0] // vals[1]
-    
-    if op == 'mod':
-        vals = [evaluate(e, env) for e in expr[1]]
-        check_number(vals[0], 'mod')
-        check_number(vals[1], 'mod')
-        return vals[0] % vals[1]
-    
-    # Comparison
-    if op == '>':
-        vals = [evaluate(e, env) for e in expr[1]]
-        check_number(vals[0], '>')
-        check_number(vals[1], '>')
-        return vals[0] > vals[1]
-    
-    if op == '<':
-        vals = [evaluate(e, env) for e in expr[1]]
-        check_number(vals[0], '<')
-        check_number(vals[1], '<')
-        return vals[0] < vals[1]
-    
-    if op == '=':
-        vals = [evaluate(e, env) for e in expr[1]]
-        for v in vals:
-            check_number(v, '=')
-        return all(v == vals[0] for v in vals)
-    
-    # Logical
-    if op == 'and':
-        for e in expr[1]:
-            val = evaluate(e, env)
-            check_boolean(val, 'and')
-            if not val:
-                return False
-        return True
-    
-    if op == 'or':
-        for e in expr[1]:
-            val = evaluate(e, env)
-            check_boolean(val, 'or')
-            if val:
-                return True
-        return False
-    
-    if op == 'not':
-        val = evaluate(expr[1], env)
-        check_boolean(val, 'not')
-        return not val
-    
-    # Function call
-    if op == 'call':
-        func = evaluate(expr[1], env)
-        if not isinstance(func, Function):
-            raise RuntimeError(f"Not a function")
-        args = [evaluate(arg, env) for arg in expr[2]]
-        return func.call(args)
-    
-    raise RuntimeError(f"Unknown operation: {op}")
-
-# ============================================================================
-# Main
-# ============================================================================
-
-def main():
-    # 讀取輸入
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as f:
-            code = f.read()
-    else:
-        code = sys.stdin.read()
-    
-    try:
-        tokens = tokenize(code)
-        parser = Parser(tokens)
-        ast = parser.parse_program()
-        
-        env = Environment()
-        for stmt in ast[1]:
-            evaluate(stmt, env)
-    except SyntaxError:
-        print("syntax error")
-    except Exception as e:
-        # Debug: 可以 uncomment 下面這行看錯誤訊息
-        # print(f"Error: {e}", file=sys.stderr)
-        pass
-
-if __name__ == '__main__':
+import re
+import sys
+from array import array
+from enum import IntEnum
+
+# ============================================================================
+# Opcodes
+# ============================================================================
+
+class Op(IntEnum):
+    """AST 節點的 tag：用小整數取代字串，dispatch 只需一次索引"""
+    PROGRAM = 0
+    VAR = 1
+    PRINT_NUM = 2
+    PRINT_BOOL = 3
+    DEFINE = 4
+    FUN = 5
+    FUN_BODY = 6
+    IF = 7
+    ADD = 8
+    SUB = 9
+    MUL = 10
+    DIV = 11
+    MOD = 12
+    GT = 13
+    LT = 14
+    EQ = 15
+    AND = 16
+    OR = 17
+    NOT = 18
+    CALL = 19
+    # Resolver 改寫後的節點（evaluator 實際執行的是這兩個，不是 VAR / DEFINE）
+    LVAR = 20
+    LDEFINE = 21
+
+# ============================================================================
+# AST Nodes
+# ============================================================================
+
+class Node:
+    """AST 節點基底
+
+    每種 op 一個固定欄位的 __slots__ class：欄位存取是 C-level 的
+    slot load，不像 tuple 索引要走泛用的 subscript 協定，每個節點
+    也省下 tuple header 的記憶體。class attribute `op` 沿用既有的
+    opcode handler table dispatch。
+    """
+    __slots__ = ()
+
+class Program(Node):
+    __slots__ = ('stmts',)
+    op = Op.PROGRAM
+
+    def __init__(self, stmts):
+        self.stmts = stmts
+
+class Var(Node):
+    __slots__ = ('name',)
+    op = Op.VAR
+
+    def __init__(self, name):
+        self.name = name
+
+class PrintNum(Node):
+    __slots__ = ('exp',)
+    op = Op.PRINT_NUM
+
+    def __init__(self, exp):
+        self.exp = exp
+
+class PrintBool(Node):
+    __slots__ = ('exp',)
+    op = Op.PRINT_BOOL
+
+    def __init__(self, exp):
+        self.exp = exp
+
+class Define(Node):
+    __slots__ = ('name', 'value')
+    op = Op.DEFINE
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+class FunBody(Node):
+    __slots__ = ('defs', 'last')
+    op = Op.FUN_BODY
+
+    def __init__(self, defs, last):
+        self.defs = defs
+        self.last = last
+
+class If(Node):
+    __slots__ = ('test', 'then_exp', 'else_exp')
+    op = Op.IF
+
+    def __init__(self, test, then_exp, else_exp):
+        self.test = test
+        self.then_exp = then_exp
+        self.else_exp = else_exp
+
+class Add(Node):
+    __slots__ = ('args',)
+    op = Op.ADD
+
+    def __init__(self, args):
+        self.args = args
+
+class Sub(Node):
+    __slots__ = ('a', 'b')
+    op = Op.SUB
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class Mul(Node):
+    __slots__ = ('args',)
+    op = Op.MUL
+
+    def __init__(self, args):
+        self.args = args
+
+class Div(Node):
+    __slots__ = ('a', 'b')
+    op = Op.DIV
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class Mod(Node):
+    __slots__ = ('a', 'b')
+    op = Op.MOD
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class Gt(Node):
+    __slots__ = ('a', 'b')
+    op = Op.GT
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class Lt(Node):
+    __slots__ = ('a', 'b')
+    op = Op.LT
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class Eq(Node):
+    __slots__ = ('args',)
+    op = Op.EQ
+
+    def __init__(self, args):
+        self.args = args
+
+class And(Node):
+    __slots__ = ('args',)
+    op = Op.AND
+
+    def __init__(self, args):
+        self.args = args
+
+class Or(Node):
+    __slots__ = ('args',)
+    op = Op.OR
+
+    def __init__(self, args):
+        self.args = args
+
+class Not(Node):
+    __slots__ = ('exp',)
+    op = Op.NOT
+
+    def __init__(self, exp):
+        self.exp = exp
+
+class Call(Node):
+    __slots__ = ('func', 'args')
+    op = Op.CALL
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+class LVar(Node):
+    __slots__ = ('depth', 'slot')
+    op = Op.LVAR
+
+    def __init__(self, depth, slot):
+        self.depth = depth
+        self.slot = slot
+
+class LDefine(Node):
+    __slots__ = ('slot', 'value')
+    op = Op.LDEFINE
+
+    def __init__(self, slot, value):
+        self.slot = slot
+        self.value = value
+
+class Fun(Node):
+    __slots__ = ('params', 'body', 'nparams', 'nlocals')
+    op = Op.FUN
+
+    def __init__(self, params, body, nlocals=None):
+        self.params = params
+        self.body = body
+        self.nparams = len(params)
+        self.nlocals = nlocals  # Resolver 解析後才知道
+
+# ============================================================================
+# Tokenizer
+# ============================================================================
+
+# 一條 master regex 描述所有 token 種類，掃描交給 C 實作的 regex engine
+# 注意順序：num 排在 op 前面，'-' 後面緊接數字時才會被併成負數（與逐字元版相同）
+TOKEN_RE = re.compile(
+    r'(?P<ws>\s+)'            # 空白
+    r'|(?P<cmt>;[^\n]*)'      # 註解
+    r'|(?P<lp>\()'            # 左括號
+    r'|(?P<rp>\))'            # 右括號
+    r'|(?P<bool>#[tf])'       # Boolean
+    r'|(?P<num>-?\d+)'        # 整數（含負數）
+    r'|(?P<id>[A-Za-z][A-Za-z0-9-]*)'  # ID: letter (letter | digit | '-')*
+    r'|(?P<op>[+\-*/<>=])'    # 單字符運算子
+)
+
+# token type tags：tokenizer 分類一次，parser 只 switch 小整數，
+# 不再對每個 token 重跑 lstrip/isdigit 或識別字驗證
+(T_EOF, T_LPAREN, T_RPAREN, T_BOOL, T_NUM, T_ID, T_OP) = range(7)
+
+_KIND_TAGS = {
+    'lp': T_LPAREN,
+    'rp': T_RPAREN,
+    'bool': T_BOOL,
+    'num': T_NUM,
+    'op': T_OP,
+}
+
+# peek 讀到結尾時回傳的 sentinel token，省掉 call site 的 None 檢查
+_EOF_TOKEN = (T_EOF, '')
+
+def tokenize(code):
+    """將輸入字串轉換為 (type, text) token 串列"""
+    tokens = []
+    append = tokens.append
+
+    for m in TOKEN_RE.finditer(code):
+        kind = m.lastgroup
+        # 空白與註解直接丟棄；其他字符 finditer 本身就會跳過
+        if kind == 'ws' or kind == 'cmt':
+            continue
+        if kind == 'id':
+            # intern 識別字（含 define / if / fun 等關鍵字）：之後 parser
+            # 的 == 比較多半變成指標比較，scope dict 也能沿用快取的 hash
+            append((T_ID, sys.intern(m.group())))
+        else:
+            append((_KIND_TAGS[kind], m.group()))
+
+    return tokens
+
+# ============================================================================
+# Parser
+# ============================================================================
+
+# 多分支共用的 operator token → AST 節點 class 對照表
+SEXP_OPS = {
+    '+': Add,
+    '-': Sub,
+    '*': Mul,
+    '/': Div,
+    'mod': Mod,
+    '>': Gt,
+    '<': Lt,
+    '=': Eq,
+    'and': And,
+    'or': Or,
+}
+
+# 同一個數字 literal（0、1、遞迴 base case 等常重複出現）共用同一個
+# int 物件：CPython 只 intern [-5, 256]，這裡以 token 字串為 key 延伸
+_INT_CACHE = {}
+
+def _is_name(token):
+    """VARIABLE token：T_ID 且小寫開頭（其餘字元 tokenizer 已保證合法）"""
+    return token[0] == T_ID and 'a' <= token[1][0] <= 'z'
+
+def parse(tokens):
+    """遞迴下降 parser，回傳 Program 節點
+
+    tokens 與 pos 放在 closure cell 裡：各 parse 函數對它們是
+    LOAD_DEREF + list 索引，比原本 Parser 物件上每次 peek/consume
+    都要走 self.tokens / self.pos 兩層屬性查找便宜。串列尾端補一個
+    EOF sentinel，token 存取不再需要邊界檢查。
+    """
+    tokens = tokens + [_EOF_TOKEN]
+    pos = 0
+
+    def consume():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        return token
+
+    def expect(ttype):
+        """消耗並檢查 token type"""
+        if consume()[0] != ttype:
+            raise SyntaxError("syntax error")
+
+    def parse_program():
+        """PROGRAM ::= STMT+"""
+        stmts = []
+        while tokens[pos] is not _EOF_TOKEN:
+            stmts.append(parse_stmt())
+        return Program(stmts)
+
+    def parse_stmt():
+        """STMT ::= EXP"""
+        return parse_exp()
+
+    def parse_exp():
+        """EXP ::= bool-val | number | VARIABLE | (...)"""
+        ttype, text = tokens[pos]
+
+        # Boolean literals（True / False 本來就是 singleton，不需 cache）
+        if ttype == T_BOOL:
+            consume()
+            return text == '#t'
+
+        # Number literals
+        if ttype == T_NUM:
+            consume()
+            value = _INT_CACHE.get(text)
+            if value is None:
+                value = _INT_CACHE[text] = int(text)
+            return value
+
+        # S-expression
+        if ttype == T_LPAREN:
+            consume()
+            return parse_sexp()
+
+        # Variable
+        if ttype == T_ID and 'a' <= text[0] <= 'z':
+            consume()
+            return Var(text)
+
+        raise SyntaxError("syntax error")
+
+    def parse_sexp():
+        """解析 S-expression (已消耗左括號)"""
+        nonlocal pos
+        ttype, op = tokens[pos]
+
+        if ttype == T_EOF or ttype == T_RPAREN:
+            raise SyntaxError("syntax error")
+
+        # Print
+        if op in ('print-num', 'print-bool'):
+            consume()
+            exp = parse_exp()
+            expect(T_RPAREN)
+            return PrintNum(exp) if op == 'print-num' else PrintBool(exp)
+
+        # Define
+        if op == 'define':
+            consume()
+            var = consume()
+            if not _is_name(var):
+                raise SyntaxError("syntax error")
+            value = parse_exp()
+            expect(T_RPAREN)
+            return Define(var[1], value)
+
+        # Function
+        if op == 'fun':
+            consume()
+            expect(T_LPAREN)
+
+            params = []
+            while tokens[pos][0] != T_RPAREN:
+                param = consume()
+                if not _is_name(param):
+                    raise SyntaxError("syntax error")
+                params.append(param[1])
+            expect(T_RPAREN)
+
+            # nested function: fun-body ::= def-stmt* exp
+            body_defs = []
+            while tokens[pos][0] == T_LPAREN:
+                saved = pos
+                consume()
+                if tokens[pos][1] == 'define':
+                    pos = saved
+                    body_defs.append(parse_exp())
+                else:
+                    pos = saved
+                    break
+
+            body = parse_exp()
+            expect(T_RPAREN)
+
+            if body_defs:
+                return Fun(params, FunBody(body_defs, body))
+            return Fun(params, body)
+
+        # If
+        if op == 'if':
+            consume()
+            test = parse_exp()
+            then_exp = parse_exp()
+            else_exp = parse_exp()
+            expect(T_RPAREN)
+            return If(test, then_exp, else_exp)
+
+        # Arithmetic operators
+        if op in ('+', '*'):
+            consume()
+            exps = []
+            while tokens[pos][0] != T_RPAREN:
+                exps.append(parse_exp())
+            expect(T_RPAREN)
+            if len(exps) < 2:
+                raise SyntaxError("syntax error")
+            return SEXP_OPS[op](exps)
+
+        if op in ('-', '/', 'mod'):
+            consume()
+            exp1 = parse_exp()
+            exp2 = parse_exp()
+            expect(T_RPAREN)
+            return SEXP_OPS[op](exp1, exp2)
+
+        # Comparison operators
+        if op == '=':
+            consume()
+            exps = []
+            while tokens[pos][0] != T_RPAREN:
+                exps.append(parse_exp())
+            expect(T_RPAREN)
+            if len(exps) < 2:
+                raise SyntaxError("syntax error")
+            return SEXP_OPS[op](exps)
+
+        if op in ('>', '<'):
+            consume()
+            exp1 = parse_exp()
+            exp2 = parse_exp()
+            expect(T_RPAREN)
+            return SEXP_OPS[op](exp1, exp2)
+
+        # Logical operators
+        if op in ('and', 'or'):
+            consume()
+            exps = []
+            while tokens[pos][0] != T_RPAREN:
+                exps.append(parse_exp())
+            expect(T_RPAREN)
+            if len(exps) < 2:
+                raise SyntaxError("syntax error")
+            return SEXP_OPS[op](exps)
+
+        if op == 'not':
+            consume()
+            exp = parse_exp()
+            expect(T_RPAREN)
+            return Not(exp)
+
+        # Function call: (func args...)
+        func = parse_exp()
+        args = []
+        while tokens[pos][0] != T_RPAREN:
+            args.append(parse_exp())
+        expect(T_RPAREN)
+        return Call(func, args)
+
+    return parse_program()
+
+# ============================================================================
+# Resolver
+# ============================================================================
+
+class Resolver:
+    """變數解析 pass：把名稱查找改寫成 (depth, slot) 索引
+
+    在 parse 之後、evaluate 之前執行。每個 scope 先把 define 的名稱
+    hoist 進 slot 表（所以前向引用與互相遞迴的函數可以解析），
+    重複定義在改寫時報錯，尚未賦值的 slot 則由執行期的 _UNDEF
+    sentinel 捕捉，對應原本 Environment 的兩種 RuntimeError。
+    """
+
+    def __init__(self):
+        self.scopes = [{}]      # name -> slot（index 0 為 global scope）
+        self.defined = [set()]  # 已出現過的參數 / define 名稱（重複定義檢查）
+
+    def hoist(self, stmts):
+        """把一串 statement 裡的 define 名稱先配置 slot"""
+        scope = self.scopes[-1]
+        for stmt in stmts:
+            if type(stmt) is Define:
+                if stmt.name not in scope:
+                    scope[stmt.name] = len(scope)
+
+    def frame_size(self):
+        return len(self.scopes[-1])
+
+    def resolve(self, expr):
+        # type() 比 isinstance() 少一層子類別判斷（bool 已明列，不需依賴 bool 是 int 子類）
+        if type(expr) is int or type(expr) is bool:
+            return expr
+
+        op = expr.op
+
+        if op == Op.VAR:
+            name = expr.name
+            for depth, scope in enumerate(reversed(self.scopes)):
+                if name in scope:
+                    return LVar(depth, scope[name])
+            raise RuntimeError(f"Undefined variable: {name}")
+
+        if op == Op.DEFINE:
+            name = expr.name
+            scope = self.scopes[-1]
+            defined = self.defined[-1]
+            if name in defined:
+                raise RuntimeError(f"Redefining variable: {name}")
+            if name not in scope:
+                scope[name] = len(scope)
+            value = self.resolve(expr.value)
+            defined.add(name)
+            return LDefine(scope[name], value)
+
+        if op == Op.FUN:
+            self.scopes.append({})
+            self.defined.append(set())
+            scope = self.scopes[-1]
+            for param in expr.params:
+                if param in scope:
+                    raise RuntimeError(f"Redefining variable: {param}")
+                scope[param] = len(scope)
+                self.defined[-1].add(param)
+            body = expr.body
+            if type(body) is FunBody:
+                self.hoist(body.defs)
+                body = FunBody([self.resolve(d) for d in body.defs],
+                               self.resolve(body.last))
+            else:
+                body = self.resolve(body)
+            nlocals = len(scope)
+            self.scopes.pop()
+            self.defined.pop()
+            return Fun(expr.params, body, nlocals)
+
+        if op == Op.IF:
+            return If(self.resolve(expr.test),
+                      self.resolve(expr.then_exp), self.resolve(expr.else_exp))
+
+        if op == Op.CALL:
+            return Call(self.resolve(expr.func),
+                        [self.resolve(a) for a in expr.args])
+
+        if op in (Op.PRINT_NUM, Op.PRINT_BOOL, Op.NOT):
+            return type(expr)(self.resolve(expr.exp))
+
+        if op in (Op.SUB, Op.DIV, Op.MOD, Op.GT, Op.LT):
+            return type(expr)(self.resolve(expr.a), self.resolve(expr.b))
+
+        # 其餘都是 args 串列形式的運算（+ * = and or）
+        return type(expr)([self.resolve(e) for e in expr.args])
+
+# ============================================================================
+# Runtime
+# ============================================================================
+
+# 已配置但尚未賦值的 slot（hoist 過、define 還沒執行到）
+_UNDEF = object()
+
+class Frame:
+    """扁平的 slot 陣列；變數存取是 (depth, slot) 索引，不做 hash 查找"""
+    __slots__ = ('slots', 'parent')
+
+    def __init__(self, slots, parent=None):
+        self.slots = slots
+        self.parent = parent
+
+class Function:
+    """閉包：不變的部分都在 Code（≈ CPython 的 code object vs function object），
+    每次建立閉包只配置這兩個欄位"""
+    __slots__ = ('code', 'closure_env')
+
+    def __init__(self, code, closure_env):
+        self.code = code
+        self.closure_env = closure_env
+
+
+# ============================================================================
+# Compiler
+# ============================================================================
+
+# Type checking 開關：在編譯期決定要不要發出 CHECK_* 指令，
+# 關掉時 bytecode 裡完全沒有檢查，VM 迴圈不再逐次讀這個全域旗標
+TYPE_CHECKING = True
+
+def type_error(expected, got):
+    """印出 type error 並結束程式"""
+    print("Type error!")
+    sys.exit(0)  # 正常結束，不是錯誤
+
+# 型別檢查直接 inline 在各 handler：type(val) is int 一次指標比較就夠
+# （True/False 的 type 是 bool 不是 int，不需要先排除 bool 再測 int）
+
+# bytecode 指令集：純 int，存在扁平的 instruction stream 裡，
+# 運算元（const index、slot、jump target、arity）直接內聯在後面
+(
+    BC_LOAD_CONST,   # 運算元: const index
+    BC_LOAD_VAR,     # 運算元: depth, slot
+    BC_LOAD_LOCAL,   # 運算元: slot（depth 0 特化：不走 parent chain）
+    BC_STORE_VAR,    # 運算元: slot（值留在 stack 上當運算式結果）
+    BC_MAKE_FUN,     # 運算元: const index（指向 Code）
+    BC_CALL,         # 運算元: 參數個數
+    BC_TAIL_CALL,    # 運算元: 參數個數（尾位置：接管 VM frame，不押 call stack）
+    BC_RETURN,
+    BC_JUMP,         # 運算元: 絕對位址
+    BC_JF,           # pop，False 就跳（運算元: 絕對位址）
+    BC_JT,           # pop，True 就跳（運算元: 絕對位址）
+    BC_POP,
+    BC_CHECK_NUM,    # peek，不是 int 就 type error
+    BC_CHECK_BOOL,   # peek，不是 bool 就 type error
+    BC_CHECK_NUM2,   # peek 頂端兩個值（二元運算的運算元）
+    BC_ADD,          # 運算元: 個數（運算元已逐一 CHECK_NUM 過）
+    BC_MUL,          # 運算元: 個數
+    BC_ADD2,         # 常見的二元 (+ a b)：不走計數迴圈
+    BC_MUL2,
+    BC_EQ2,
+    BC_SUB,
+    BC_DIV,
+    BC_MOD,
+    BC_GT,
+    BC_LT,
+    BC_EQ_JNE,       # pop 比較值，和 stack top 的第一個運算元不相等就跳（運算元: 位址）
+    BC_NOT,
+    BC_PRINT_NUM,
+    BC_PRINT_BOOL,
+) = range(29)
+
+class Code:
+    """一段編好的 bytecode：function body 或單一 top-level statement"""
+    __slots__ = ('bytecode', 'consts', 'nparams', 'pad')
+
+    def __init__(self, bytecode, consts, nparams, nlocals):
+        # 編譯期用 list 方便 patch jump，定版後轉成連續的 C int 陣列：
+        # 比 Python int 物件的 list 省記憶體，快取局部性也較好
+        self.bytecode = array('i', bytecode)
+        self.consts = consts
+        self.nparams = nparams
+        # 區域 define 需要的額外 slot：編譯期算一次，呼叫時直接 extend
+        self.pad = (_UNDEF,) * (nlocals - nparams)
+
+class Compiler:
+    """把解析完的 AST 壓成扁平 bytecode
+
+    每個運算式編出「淨推一個值」的指令序列，operand fetch 變成對
+    連續 int 串列的索引，取代 tree walk 的逐節點 pointer chase。
+    and / or 用 jump 實作短路；type check 編成獨立的 CHECK_* 指令，
+    緊跟在各運算元之後，維持和 tree walker 相同的報錯時機。
+    """
+
+    def __init__(self):
+        self.bc = []
+        self.consts = []
+
+    def emit(self, *ints):
+        self.bc.extend(ints)
+
+    def const(self, value):
+        # 不去重：== 去重會把 True 和 1 視為同一個常數
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def jump(self, opcode):
+        """發出帶占位目標的跳躍，回傳待回填的位置"""
+        self.emit(opcode, -1)
+        return len(self.bc) - 1
+
+    def patch(self, pos):
+        self.bc[pos] = len(self.bc)
+
+    def compile(self, node, tail=False):
+        if type(node) is int or type(node) is bool:
+            self.emit(BC_LOAD_CONST, self.const(node))
+            return
+
+        op = node.op
+
+        if op == Op.LVAR:
+            # 大多數存取是當前 frame（參數、區域 define）：免走 parent chain
+            if node.depth == 0:
+                self.emit(BC_LOAD_LOCAL, node.slot)
+            else:
+                self.emit(BC_LOAD_VAR, node.depth, node.slot)
+            return
+
+        if op == Op.LDEFINE:
+            self.compile(node.value)
+            self.emit(BC_STORE_VAR, node.slot)
+            return
+
+        if op == Op.FUN:
+            self.emit(BC_MAKE_FUN, self.const(compile_function(node)))
+            return
+
+        if op == Op.IF:
+            self.compile(node.test)
+            if TYPE_CHECKING:
+                self.emit(BC_CHECK_BOOL)
+            jf = self.jump(BC_JF)
+            self.compile(node.then_exp, tail)   # 分支繼承尾位置
+            jend = self.jump(BC_JUMP)
+            self.patch(jf)
+            self.compile(node.else_exp, tail)
+            self.patch(jend)
+            return
+
+        if op == Op.CALL:
+            self.compile(node.func)
+            for arg in node.args:
+                self.compile(arg)
+            self.emit(BC_TAIL_CALL if tail else BC_CALL, len(node.args))
+            return
+
+        if op == Op.ADD or op == Op.MUL:
+            for e in node.args:
+                self.compile(e)
+                if TYPE_CHECKING:
+                    self.emit(BC_CHECK_NUM)
+            # 絕大多數是二元：發特化指令，VM 端省掉計數與 slice
+            if len(node.args) == 2:
+                self.emit(BC_ADD2 if op == Op.ADD else BC_MUL2)
+            else:
+                self.emit(BC_ADD if op == Op.ADD else BC_MUL, len(node.args))
+            return
+
+        if op == Op.EQ:
+            self.compile(node.args[0])
+            if TYPE_CHECKING:
+                self.emit(BC_CHECK_NUM)
+            if len(node.args) == 2:
+                self.compile(node.args[1])
+                if TYPE_CHECKING:
+                    self.emit(BC_CHECK_NUM)
+                self.emit(BC_EQ2)
+                return
+            # 三個以上和 and / or 同型：逐一跟第一個比，
+            # 一不相等就跳出，後面的運算元連評估都不評估
+            outs = []
+            for e in node.args[1:]:
+                self.compile(e)
+                if TYPE_CHECKING:
+                    self.emit(BC_CHECK_NUM)
+                outs.append(self.jump(BC_EQ_JNE))
+            self.emit(BC_POP)   # 丟掉留在 stack 上的第一個運算元
+            self.emit(BC_LOAD_CONST, self.const(True))
+            jend = self.jump(BC_JUMP)
+            for pos in outs:
+                self.patch(pos)
+            self.emit(BC_POP)
+            self.emit(BC_LOAD_CONST, self.const(False))
+            self.patch(jend)
+            return
+
+        if op == Op.AND or op == Op.OR:
+            shortcut = BC_JF if op == Op.AND else BC_JT
+            outs = []
+            for e in node.args:
+                self.compile(e)
+                if TYPE_CHECKING:
+                    self.emit(BC_CHECK_BOOL)
+                outs.append(self.jump(shortcut))
+            self.emit(BC_LOAD_CONST, self.const(op == Op.AND))
+            jend = self.jump(BC_JUMP)
+            for pos in outs:
+                self.patch(pos)
+            self.emit(BC_LOAD_CONST, self.const(op == Op.OR))
+            self.patch(jend)
+            return
+
+        if op == Op.NOT:
+            self.compile(node.exp)
+            if TYPE_CHECKING:
+                self.emit(BC_CHECK_BOOL)
+            self.emit(BC_NOT)
+            return
+
+        if op == Op.PRINT_NUM or op == Op.PRINT_BOOL:
+            self.compile(node.exp)
+            if TYPE_CHECKING:
+                self.emit(BC_CHECK_NUM if op == Op.PRINT_NUM else BC_CHECK_BOOL)
+            self.emit(BC_PRINT_NUM if op == Op.PRINT_NUM else BC_PRINT_BOOL)
+            return
+
+        if op in _BIN_BC:
+            self.compile(node.a)
+            self.compile(node.b)
+            # 兩個運算元都評估完才檢查，維持原本的報錯時機
+            if TYPE_CHECKING:
+                self.emit(BC_CHECK_NUM2)
+            self.emit(_BIN_BC[op])
+            return
+
+        # VAR / DEFINE / PROGRAM 不應該出現在 resolve 過的樹裡
+        raise RuntimeError(f"Cannot compile: {op!r}")
+
+_BIN_BC = {
+    Op.SUB: BC_SUB,
+    Op.DIV: BC_DIV,
+    Op.MOD: BC_MOD,
+    Op.GT: BC_GT,
+    Op.LT: BC_LT,
+}
+
+def compile_function(node):
+    """把 Fun 節點的 body 編成 Code（巢狀 define 先跑、結尾是尾位置）"""
+    c = Compiler()
+    body = node.body
+    if type(body) is FunBody:
+        for d in body.defs:
+            c.compile(d)
+            c.emit(BC_POP)
+        c.compile(body.last, tail=True)
+    else:
+        c.compile(body, tail=True)
+    c.emit(BC_RETURN)
+    return Code(c.bc, c.consts, node.nparams, node.nlocals)
+
+def compile_stmt(stmt):
+    """把單一 top-level statement 編成 Code"""
+    c = Compiler()
+    c.compile(stmt, tail=True)
+    c.emit(BC_RETURN)
+    return Code(c.bc, c.consts, 0, 0)
+
+# ============================================================================
+# VM
+# ============================================================================
+
+def run(code, frame):
+    """扁平 bytecode 的直譯迴圈
+
+    和 CPython 的 ceval 同形狀：pc 走過 int 指令串列，值放 value
+    stack。函數呼叫不經過 Python 遞迴——BC_CALL 把呼叫者的
+    (bc, consts, pc, stack, frame) 押進顯式的 call stack，
+    BC_TAIL_CALL 直接接管現場，所以尾呼叫仍是 O(1) stack、
+    深的非尾遞迴也只長 heap 上的串列。
+    """
+    bc = code.bytecode
+    consts = code.consts
+    pc = 0
+    stack = []
+    call_stack = []
+
+    while True:
+        op = bc[pc]
+        pc += 1
+
+        if op == BC_LOAD_CONST:
+            stack.append(consts[bc[pc]])
+            pc += 1
+
+        elif op == BC_LOAD_LOCAL:
+            value = frame.slots[bc[pc]]
+            if value is _UNDEF:
+                raise RuntimeError("Undefined variable")
+            stack.append(value)
+            pc += 1
+
+        elif op == BC_LOAD_VAR:
+            depth = bc[pc]
+            env = frame
+            while depth:
+                env = env.parent
+                depth -= 1
+            value = env.slots[bc[pc + 1]]
+            if value is _UNDEF:
+                raise RuntimeError("Undefined variable")
+            stack.append(value)
+            pc += 2
+
+        elif op == BC_CHECK_NUM:
+            if type(stack[-1]) is not int:
+                type_error('number', stack[-1])
+
+        elif op == BC_CHECK_BOOL:
+            value = stack[-1]
+            if value is not True and value is not False:
+                type_error('boolean', value)
+
+        elif op == BC_CHECK_NUM2:
+            if type(stack[-1]) is not int or type(stack[-2]) is not int:
+                type_error('number', stack[-2:])
+
+        elif op == BC_JF:
+            pc = bc[pc] if stack.pop() is False else pc + 1
+
+        elif op == BC_JT:
+            pc = bc[pc] if stack.pop() is True else pc + 1
+
+        elif op == BC_JUMP:
+            pc = bc[pc]
+
+        elif op == BC_ADD2:
+            b = stack.pop()
+            stack[-1] = stack[-1] + b
+
+        elif op == BC_MUL2:
+            b = stack.pop()
+            stack[-1] = stack[-1] * b
+
+        elif op == BC_EQ2:
+            b = stack.pop()
+            stack[-1] = stack[-1] == b
+
+        elif op == BC_ADD:
+            n = bc[pc]
+            pc += 1
+            acc = sum(stack[-n:])
+            del stack[-n:]
+            stack.append(acc)
+
+        elif op == BC_MUL:
+            n = bc[pc]
+            pc += 1
+            acc = 1
+            for value in stack[-n:]:
+                acc *= value
+            del stack[-n:]
+            stack.append(acc)
+
+        elif op == BC_SUB:
+            b = stack.pop()
+            a = stack.pop()
+            stack.append(a - b)
+
+        elif op == BC_DIV:
+            b = stack.pop()
+            a = stack.pop()
+            stack.append(a // b)
+
+        elif op == BC_MOD:
+            b = stack.pop()
+            a = stack.pop()
+            stack.append(a % b)
+
+        elif op == BC_GT:
+            b = stack.pop()
+            a = stack.pop()
+            stack.append(a > b)
+
+        elif op == BC_LT:
+            b = stack.pop()
+            a = stack.pop()
+            stack.append(a < b)
+
+        elif op == BC_EQ_JNE:
+            b = stack.pop()
+            pc = bc[pc] if stack[-1] != b else pc + 1
+
+        elif op == BC_NOT:
+            stack.append(not stack.pop())
+
+        elif op == BC_POP:
+            stack.pop()
+
+        elif op == BC_STORE_VAR:
+            frame.slots[bc[pc]] = stack[-1]
+            pc += 1
+
+        elif op == BC_MAKE_FUN:
+            stack.append(Function(consts[bc[pc]], frame))
+            pc += 1
+
+        elif op == BC_CALL or op == BC_TAIL_CALL:
+            n = bc[pc]
+            pc += 1
+            if n:
+                args = stack[-n:]
+                del stack[-n:]
+            else:
+                args = []
+            func = stack.pop()
+            if type(func) is not Function:
+                raise RuntimeError(f"Not a function")
+            fcode = func.code
+            if n != fcode.nparams:
+                raise RuntimeError(f"Arity mismatch: expected {fcode.nparams}, got {n}")
+            if fcode.pad:
+                args.extend(fcode.pad)
+            if op == BC_CALL:
+                call_stack.append((bc, consts, pc, stack, frame))
+            bc = fcode.bytecode
+            consts = fcode.consts
+            pc = 0
+            stack = []
+            frame = Frame(args, func.closure_env)
+
+        elif op == BC_PRINT_NUM:
+            print(stack[-1])
+
+        elif op == BC_PRINT_BOOL:
+            print('#t' if stack[-1] else '#f')
+
+        elif op == BC_RETURN:
+            value = stack.pop()
+            if not call_stack:
+                return value
+            bc, consts, pc, stack, frame = call_stack.pop()
+            stack.append(value)
+
+        else:
+            raise RuntimeError(f"Unknown opcode: {op}")
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    # 讀取輸入
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as f:
+            code = f.read()
+    else:
+        code = sys.stdin.read()
+    
+    try:
+        tokens = tokenize(code)
+        ast = parse(tokens)
+
+        # 先 hoist 整個 program 的 define（互相遞迴的函數才查得到彼此），
+        # 再逐句 resolve + evaluate，保持和原本一樣的輸出順序
+        resolver = Resolver()
+        stmts = ast.stmts
+        resolver.hoist(stmts)
+        env = Frame([_UNDEF] * resolver.frame_size())
+        for stmt in stmts:
+            node = resolver.resolve(stmt)
+            # 運算式位置的 define（如 (print-num (define x 5))）不會被
+            # hoist，resolve 時才配置新 slot，這裡把全域 frame 補齊
+            grow = resolver.frame_size() - len(env.slots)
+            if grow > 0:
+                env.slots.extend([_UNDEF] * grow)
+            run(compile_stmt(node), env)
+    except SyntaxError:
+        print("syntax error")
+    except Exception as e:
+        # Debug: 可以 uncomment 下面這行看錯誤訊息
+        # print(f"Error: {e}", file=sys.stderr)
+        pass
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
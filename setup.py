@@ -0,0 +1,26 @@
+"""選用的編譯安裝腳本
+
+主程式 main.py 本身是純 Python（無需額外套件），但若環境裝有 Cython
+與 C 編譯器，可用本腳本把 tokenizer / parser / evaluator 編成 C 擴充模組：
+
+    pip install cython
+    python setup.py build_ext --inplace
+
+沒有 Cython 時直接用 `python main.py` 執行即可，行為完全相同。
+"""
+
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+    # pure-Python mode：直接編譯 main.py，不需改寫成 .pyx
+    ext_modules = cythonize(['main.py'], language_level=3)
+except ImportError:
+    ext_modules = []
+
+setup(
+    name='mini-lisp-interpreter',
+    version='1.0',
+    py_modules=['main'],
+    ext_modules=ext_modules,
+)